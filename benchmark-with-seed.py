@@ -1,24 +1,90 @@
 import sqlite3
-import random
 import string
 import time
 import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import numpy as np
 from tabulate import tabulate
 import threading
+import itertools
+import queue
 import os
 
+try:
+    import apsw
+except ImportError:
+    apsw = None
+
 DB_NAME = 'test.db'
 thread_local = threading.local()
 
-def init_db(wal_mode=False):
+DRIVERS = ['sqlite3', 'apsw']
+PAGE_SIZES = [512 << i for i in range(8)]  # Every page size SQLite accepts, 512 to 65536
+DB_ERRORS = (sqlite3.Error, apsw.Error) if apsw else (sqlite3.Error,)
+
+# Writes are funneled through a single writer thread that commits them in batches
+write_queue = queue.Queue()
+
+# Progress bars are only refreshed every this many queries to keep their locking out of the hot loop
+PROGRESS_INTERVAL = 1024
+
+# Applied once per connection when WAL optimization is enabled
+PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 10000',
+    'PRAGMA cache_size = 4096',
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Applied to every read-only connection, reads go through mmap instead of read() + copy
+READ_PRAGMAS = [
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -64000',
+    'PRAGMA query_only = 1',
+]
+
+TABLES = ['projects', 'users', 'tasks', 'notes']
+
+# Ids for new rows start after the seeded ones so inserts never have to look up the next rowid
+next_ids = {table: itertools.count(1000001) for table in TABLES}
+
+# Queries are picked by index, reads by table and writes from (sql, params builder) pairs
+READ_SQLS = tuple(f'SELECT * FROM {table} WHERE id = ?' for table in TABLES)
+
+# Builders get three random ids in [1, 1000000]
+WRITES = (
+    ('INSERT INTO projects (id, name) VALUES (?, ?)',
+     lambda a, b, c: (next(next_ids['projects']), f'New Project {a}')),
+    ('INSERT INTO users (id, name) VALUES (?, ?)',
+     lambda a, b, c: (next(next_ids['users']), f'New User {a}')),
+    ('INSERT INTO tasks (id, project_id, user_id, description, completed) VALUES (?, ?, ?, ?, ?)',
+     lambda a, b, c: (next(next_ids['tasks']), a, b, f'New Task {c}', False)),
+    ('INSERT INTO notes (id, project_id, user_id, content) VALUES (?, ?, ?, ?)',
+     lambda a, b, c: (next(next_ids['notes']), a, b, f'New Note {c}')),
+    ('UPDATE tasks SET completed = ? WHERE id = ?',
+     lambda a, b, c: (True, a)),
+    ('DELETE FROM projects WHERE id = ?', lambda a, b, c: (a,)),
+    ('DELETE FROM users WHERE id = ?', lambda a, b, c: (a,)),
+    ('DELETE FROM tasks WHERE id = ?', lambda a, b, c: (a,)),
+    ('DELETE FROM notes WHERE id = ?', lambda a, b, c: (a,)),
+)
+# Insert, update and delete are equally likely, inserts and deletes are then spread over the four tables
+WRITE_WEIGHTS = [1 / 12] * 4 + [1 / 3] + [1 / 12] * 4
+
+def init_db(wal_mode=False, page_size=4096):
     if os.path.exists(DB_NAME):
         os.remove(DB_NAME)
 
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
+    # The file is brand new, settings made before the first table is created need no VACUUM to apply
+    c.execute(f'PRAGMA page_size = {page_size}')
+    # auto_vacuum stays off on purpose, INCREMENTAL would add pointer-map page updates to every timed write
+    if wal_mode:
+        c.execute('PRAGMA journal_mode = WAL')
+    else:
+        c.execute('PRAGMA journal_mode = DELETE')
     c.execute('''
         CREATE TABLE IF NOT EXISTS projects (
             id INTEGER PRIMARY KEY,
@@ -52,12 +118,7 @@ def init_db(wal_mode=False):
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
-    c.execute('VACUUM')
     c.execute('PRAGMA optimize')
-    if wal_mode:
-        c.execute('PRAGMA journal_mode = WAL')
-    else:
-        c.execute('PRAGMA journal_mode = DELETE')
     conn.commit()
     conn.close()
 
@@ -65,154 +126,304 @@ def seed_db():
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
 
-    # Seed projects
-    for i in range(1, 1000001):
-        c.execute('INSERT INTO projects (name) VALUES (?)', (f'Project {i}',))
-
-    # Seed users
-    for i in range(1, 1000001):
-        c.execute('INSERT INTO users (name) VALUES (?)', (f'User {i}',))
-
-    # Seed tasks
-    for i in range(1, 1000001):
-        project_id = random.randint(1, 1000000)
-        user_id = random.randint(1, 1000000)
-        c.execute('INSERT INTO tasks (project_id, user_id, description, completed) VALUES (?, ?, ?, ?)',
-                  (project_id, user_id, f'Task {i}', False))
-
-    # Seed notes
-    for i in range(1, 1000001):
-        project_id = random.randint(1, 1000000)
-        user_id = random.randint(1, 1000000)
-        c.execute('INSERT INTO notes (project_id, user_id, content) VALUES (?, ?, ?)',
-                  (project_id, user_id, f'Note {i}'))
-
-    conn.commit()
+    # Trade durability for speed while seeding, the data is thrown away anyway
+    journal_mode = c.execute('PRAGMA journal_mode').fetchone()[0]
+    c.execute('PRAGMA journal_mode = OFF')
+    c.execute('PRAGMA synchronous = OFF')
+    c.execute('PRAGMA temp_store = MEMORY')
+    c.execute('PRAGMA cache_size = -200000')
+
+    rng = np.random.default_rng()
+    with conn:
+        # Seed projects
+        c.executemany('INSERT INTO projects (name) VALUES (?)',
+                      ((f'Project {i}',) for i in range(1, 1000001)))
+
+        # Seed users
+        c.executemany('INSERT INTO users (name) VALUES (?)',
+                      ((f'User {i}',) for i in range(1, 1000001)))
+
+        # Seed tasks
+        project_ids = rng.integers(1, 1000001, size=1000000, dtype=np.int64)
+        user_ids = rng.integers(1, 1000001, size=1000000, dtype=np.int64)
+        c.executemany('INSERT INTO tasks (project_id, user_id, description, completed) VALUES (?, ?, ?, ?)',
+                      ((p, u, f'Task {i + 1}', False)
+                       for i, (p, u) in enumerate(zip(project_ids.tolist(), user_ids.tolist()))))
+
+        # Seed notes
+        project_ids = rng.integers(1, 1000001, size=1000000, dtype=np.int64)
+        user_ids = rng.integers(1, 1000001, size=1000000, dtype=np.int64)
+        c.executemany('INSERT INTO notes (project_id, user_id, content) VALUES (?, ?, ?)',
+                      ((p, u, f'Note {i + 1}')
+                       for i, (p, u) in enumerate(zip(project_ids.tolist(), user_ids.tolist()))))
+
+    # Restore the journal mode picked in init_db, the other PRAGMAs only live as long as this connection
+    c.execute(f'PRAGMA journal_mode = {journal_mode}')
     conn.close()
 
-def get_connection():
-    if not hasattr(thread_local, "connection"):
-        thread_local.connection = sqlite3.connect(DB_NAME, check_same_thread=False)
-    return thread_local.connection
-
-def optimize_db(c, optimize_wal):
+def open_connection(database, optimize_wal, driver, pragmas=(), uri=False):
+    # Both drivers run in autocommit mode, transactions are opened explicitly by the writer
+    if driver == 'apsw':
+        flags = apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE | (apsw.SQLITE_OPEN_URI if uri else 0)
+        conn = apsw.Connection(database, flags=flags, statementcachesize=512)
+        conn.setbusytimeout(5000)  # Same as the 5 second default timeout of sqlite3.connect
+    else:
+        conn = sqlite3.connect(database, uri=uri, isolation_level=None, check_same_thread=False, cached_statements=512)
     if optimize_wal:
-        c.execute('PRAGMA synchronous = NORMAL')
-        c.execute('PRAGMA busy_timeout = 10000')
-        c.execute('PRAGMA cache_size = 4096')
-        c.execute('PRAGMA temp_store = MEMORY')
-    pass
-
-def read_operation(optimize_wal):
-    start_time = time.time()
-    conn = get_connection()
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+def get_read_connection(optimize_wal, driver):
+    if not hasattr(thread_local, "read_connection"):
+        thread_local.read_connection = open_connection(f'file:{DB_NAME}?mode=ro', optimize_wal, driver, READ_PRAGMAS, uri=True)
+        thread_local.read_cursor = thread_local.read_connection.cursor()
+    return thread_local.read_connection
+
+def get_write_connection(optimize_wal, driver):
+    if not hasattr(thread_local, "write_connection"):
+        thread_local.write_connection = open_connection(DB_NAME, optimize_wal, driver)
+        thread_local.write_cursor = thread_local.write_connection.cursor()
+    return thread_local.write_connection
+
+def commit_batch(batch, optimize_wal, driver):
+    conn = get_write_connection(optimize_wal, driver)
+    c = thread_local.write_cursor
+    try:
+        c.execute('BEGIN')
+        for sql, params, _ in batch:
+            c.execute(sql, params)
+        c.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        raise
+
+def writer(optimize_wal, driver, batch_size, commit_interval):
+    stop = False
+    while not stop:
+        # Collect writes until the batch is full or commit_interval has passed since the first one
+        batch = [write_queue.get()]
+        deadline = time.perf_counter() + commit_interval
+        while len(batch) < batch_size and batch[-1] is not None:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(write_queue.get(timeout=timeout) if timeout > 0 else write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            stop = True
+            batch.remove(None)
+        if not batch:
+            continue
+        error = RuntimeError('the writer thread stopped before committing this write')
+        try:
+            commit_batch(batch, optimize_wal, driver)
+            error = None
+        except Exception as e:
+            error = e
+        finally:
+            # Always answer the waiting clients, failures are handed back to them instead of being dropped here
+            for _, _, done in batch:
+                if error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(error)
+
+def start_writer(optimize_wal, driver, batch_size, commit_interval):
+    writer_thread = threading.Thread(target=writer, args=(optimize_wal, driver, batch_size, commit_interval), daemon=True)
+    writer_thread.start()
+    return writer_thread
+
+def stop_writer(writer_thread):
+    write_queue.put(None)
+    writer_thread.join()
+
+def queue_write(sql, params):
+    done = Future()
+    write_queue.put((sql, params, done))
+    done.result()  # Raises whatever made the writer fail this write
+
+def read_operation(table, rid, optimize_wal, driver):
+    start_time = time.perf_counter_ns()
+    get_read_connection(optimize_wal, driver)
     try:
-        c = conn.cursor()
-        optimize_db(c, optimize_wal)
-        table = random.choice(['projects', 'users', 'tasks', 'notes'])
-        c.execute(f'SELECT * FROM {table} WHERE id = ?', (random.randint(1, 1000000),))
-        result = c.fetchone()
-    except sqlite3.Error as e:
+        c = thread_local.read_cursor
+        c.execute(READ_SQLS[table], (rid,))
+        result = c.fetchall()  # Drain the statement so it does not keep a read transaction open
+    except DB_ERRORS as e:
         print(f"An error occurred: {e}")
-    duration = time.time() - start_time
-    return duration, 'read'
+    duration = time.perf_counter_ns() - start_time
+    return duration, False
 
-def write_operation(optimize_wal):
-    start_time = time.time()
-    conn = get_connection()
+def write_operation(write, ids):
+    start_time = time.perf_counter_ns()
+    sql, build_params = WRITES[write]
     try:
-        c = conn.cursor()
-        optimize_db(c, optimize_wal)
-        operation = random.choice(['insert', 'update', 'delete'])
-        if operation == 'insert':
-            table = random.choice(['projects', 'users', 'tasks', 'notes'])
-            if table == 'projects':
-                c.execute('INSERT INTO projects (name) VALUES (?)', (f'New Project {random.randint(1, 1000000)}',))
-            elif table == 'users':
-                c.execute('INSERT INTO users (name) VALUES (?)', (f'New User {random.randint(1, 1000000)}',))
-            elif table == 'tasks':
-                project_id = random.randint(1, 1000000)
-                user_id = random.randint(1, 1000000)
-                c.execute('INSERT INTO tasks (project_id, user_id, description, completed) VALUES (?, ?, ?, ?)',
-                          (project_id, user_id, f'New Task {random.randint(1, 1000000)}', False))
-            elif table == 'notes':
-                project_id = random.randint(1, 1000000)
-                user_id = random.randint(1, 1000000)
-                c.execute('INSERT INTO notes (project_id, user_id, content) VALUES (?, ?, ?)',
-                          (project_id, user_id, f'New Note {random.randint(1, 1000000)}'))
-        elif operation == 'update':
-            table = random.choice(['tasks'])
-            if table == 'tasks':
-                task_id = random.randint(1, 1000000)
-                c.execute('UPDATE tasks SET completed = ? WHERE id = ?', (True, task_id))
-        elif operation == 'delete':
-            table = random.choice(['projects', 'users', 'tasks', 'notes'])
-            if table == 'projects':
-                project_id = random.randint(1, 1000000)
-                c.execute('DELETE FROM projects WHERE id = ?', (project_id,))
-            elif table == 'users':
-                user_id = random.randint(1, 1000000)
-                c.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            elif table == 'tasks':
-                task_id = random.randint(1, 1000000)
-                c.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-            elif table == 'notes':
-                note_id = random.randint(1, 1000000)
-                c.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-        conn.commit()
-    except sqlite3.Error as e:
+        queue_write(sql, build_params(*ids))
+    except DB_ERRORS as e:
         print(f"An error occurred: {e}")
-    duration = time.time() - start_time
-    return duration, 'write'
+    duration = time.perf_counter_ns() - start_time
+    return duration, True
 
-def perform_query(write_percentage, optimize_wal):
-    if random.random() < write_percentage:
-        return write_operation(optimize_wal)
+def perform_query(coin, table, write, ids, write_percentage, optimize_wal, driver):
+    if coin < write_percentage:
+        return write_operation(write, ids)
     else:
-        return read_operation(optimize_wal)
-
-def client_worker(client_id, num_queries, write_percentage, results, progress_bars, start_time, optimize_wal):
-    while time.time() < start_time:
-        pass
-
-    pbar = progress_bars[client_id]
-    client_results = []
-    for _ in range(num_queries):
-        result = perform_query(write_percentage, optimize_wal)
-        client_results.append(result)
-        pbar.update(1)
-    results[client_id] = client_results
-
-def run_queries(num_clients, num_queries, write_percentage, start_time, optimize_wal):
-    results = [None] * num_clients
+        return read_operation(table, ids[0], optimize_wal, driver)
+
+def draw_queries(num_queries):
+    # Random decisions for a whole run of queries, drawn up front instead of once per query
+    rng = np.random.default_rng()
+    coins = rng.random(num_queries).tolist()
+    tables = rng.integers(0, len(READ_SQLS), size=num_queries).tolist()
+    writes = rng.choice(len(WRITES), size=num_queries, p=WRITE_WEIGHTS).tolist()
+    ids = rng.integers(1, 1000001, size=(num_queries, 3), dtype=np.int64).tolist()
+    return coins, tables, writes, ids
+
+def client_worker(client_id, num_queries, write_percentage, durations, is_write, progress_bars, barrier, optimize_wal, driver):
+    try:
+        coins, tables, writes, ids = draw_queries(num_queries)
+        get_read_connection(optimize_wal, driver)  # Open the connection before the clock starts
+    except BaseException:
+        barrier.abort()  # Release the clients already parked on the barrier instead of leaving them waiting forever
+        raise
+    barrier.wait()
+
+    pbar = progress_bars[client_id] if progress_bars else None
+    for i in range(num_queries):
+        durations[i], is_write[i] = perform_query(coins[i], tables[i], writes[i], ids[i], write_percentage, optimize_wal, driver)
+        if pbar is not None and (i + 1) % PROGRESS_INTERVAL == 0:
+            pbar.update(PROGRESS_INTERVAL)
+    finished = (time.perf_counter(), read_bytes_written())
+    if pbar is not None:
+        pbar.update(num_queries % PROGRESS_INTERVAL)
+    return finished
+
+def run_queries(num_clients, num_queries, write_percentage, optimize_wal, driver, progress):
     queries_per_client = num_queries
     remaining_queries = num_queries
 
-    progress_bars = [tqdm(total=queries_per_client + (1 if i < remaining_queries else 0),
-                          desc=f"Client {i+1}", position=i)
-                     for i in range(num_clients)]
+    client_queries = [queries_per_client + (1 if i < remaining_queries else 0) for i in range(num_clients)]
+    progress_bars = [tqdm(total=client_queries[i], desc=f"Client {i+1}", position=i)
+                     for i in range(num_clients)] if progress else []
+
+    # One buffer for the whole run, every client fills its own slice of it
+    offsets = np.concatenate(([0], np.cumsum(client_queries)))
+    durations = np.empty(offsets[-1], dtype=np.int64)
+    is_write = np.empty(offsets[-1], dtype=np.bool_)
+
+    # Clients park on the barrier until all of them are ready, the last one to arrive records the start
+    started = []
+    barrier = threading.Barrier(num_clients, action=lambda: started.append((time.perf_counter(), read_bytes_written())))
 
     with ThreadPoolExecutor(max_workers=num_clients) as executor:
         futures = []
         for i in range(num_clients):
-            client_queries = queries_per_client + (1 if i < remaining_queries else 0)
-            futures.append(executor.submit(client_worker, i, client_queries, write_percentage, results, progress_bars, start_time, optimize_wal))
+            start, end = offsets[i], offsets[i + 1]
+            futures.append(executor.submit(client_worker, i, client_queries[i], write_percentage, durations[start:end], is_write[start:end], progress_bars, barrier, optimize_wal, driver))
 
-        for future in as_completed(futures):
-            future.result()
+        # A client failing before the start breaks the barrier for everyone, report that failure rather than the broken barrier
+        errors = [future.exception() for future in as_completed(futures) if future.exception() is not None]
+        errors.sort(key=lambda e: isinstance(e, threading.BrokenBarrierError))
+        if errors:
+            raise errors[0]
+        finished = [future.result() for future in futures]
 
     for pbar in progress_bars:
         pbar.close()
 
-    return [item for sublist in results for item in sublist]
+    # The run ends when the last client is done with its queries, not when the pool is torn down
+    start_time, written_at_start = started[0]
+    end_time = max(end for end, _ in finished)
+    # With progress bars on their terminal output would be counted as written bytes too
+    if progress or written_at_start is None:
+        bytes_written = None
+    else:
+        bytes_written = max(written for _, written in finished) - written_at_start
+
+    return start_time, end_time, bytes_written, durations, is_write
 
 def calculate_percentiles(durations, percentiles=[99.9, 99, 95, 90, 50]):
-    return {p: np.percentile(durations, p) * 1000 for p in percentiles}  # Convert to milliseconds
+    # One partition pass places every requested rank, a full sort is not needed for a handful of them
+    durations = np.asarray(durations, dtype=np.int64)
+    if durations.size == 0:
+        return {p: float('nan') for p in percentiles}
+    ranks = [int(round(p / 100 * (durations.size - 1))) for p in percentiles]
+    partitioned = np.partition(durations, ranks)
+    return {p: partitioned[k] / 1e6 for p, k in zip(percentiles, ranks)}  # Convert to milliseconds
+
+def read_bytes_written():
+    # Bytes this process has handed to write syscalls so far, only available on Linux
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(counters['wchar'])
+
+def bytes_per_lookup(conn, tables):
+    # A point lookup reads one page per B-tree level, the dbstat table is optional in SQLite builds so this can be unknown
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    try:
+        depths = [conn.execute("SELECT max(length(path) - length(replace(path, '/', ''))) FROM dbstat WHERE name = ?", (table,)).fetchone()[0]
+                  for table in tables]
+    except DB_ERRORS:
+        return None
+    return page_size * np.mean(depths)
+
+def print_results(durations, is_write, num_queries, total_duration, lookup_bytes, bytes_written):
+    write_durations = durations[is_write]
+    read_durations = durations[~is_write]
+    total_reads = len(read_durations)
+    total_writes = len(write_durations)
 
-def warm_up(num_queries, optimize_wal):
+    read_percentiles = calculate_percentiles(read_durations)
+    write_percentiles = calculate_percentiles(write_durations)
+
+    print(f'\nTotal queries: {num_queries}')
+    print(f'Total reads: {total_reads}')
+    print(f'Total writes: {total_writes}')
+    print(f'Total duration: {total_duration:.2f} seconds')
+    print(f'Queries per second: {num_queries / total_duration:.2f}')
+    print(f'Reads per second: {total_reads / total_duration:.2f}')
+    print(f'Writes per second: {total_writes / total_duration:.2f}')
+    if lookup_bytes is not None:
+        print(f'Bytes read per lookup: {lookup_bytes:.0f} (page size x B-tree depth)')
+    if bytes_written is not None and total_writes:
+        # Measured from write syscalls over the timed run, that is the WAL or journal traffic of the writer
+        print(f'Bytes written per write: {bytes_written / total_writes:.0f}')
+
+    table = [[f"P{p}", f"{write_percentiles[p]:.3f}", f"{read_percentiles[p]:.3f}"] for p in sorted(read_percentiles.keys(), reverse=True)]
+    print('\nPercentiles (milliseconds):')
+    print(tabulate(table, headers=['Percentile', 'Write', 'Read'], tablefmt='grid'))
+
+    # Add average (mean) durations
+    avg_write = write_durations.mean() / 1e6 if total_writes else float('nan')  # Convert to milliseconds
+    avg_read = read_durations.mean() / 1e6 if total_reads else float('nan')      # Convert to milliseconds
+    print(f"\nAverage durations (milliseconds):")
+    print(f"Write: {avg_write:.3f}")
+    print(f"Read: {avg_read:.3f}")
+
+def warm_up(num_queries, optimize_wal, driver):
     print("Warming up...")
-    for _ in tqdm(range(num_queries), desc="Warm-up"):
-        perform_query(0.5, optimize_wal)  # 50% write operations during warm-up
+    coins, tables, writes, ids = draw_queries(num_queries)
+    for i in tqdm(range(num_queries), desc="Warm-up"):
+        perform_query(coins[i], tables[i], writes[i], ids[i], 0.5, optimize_wal, driver)  # 50% write operations during warm-up
+
+def prime_cache(optimize_wal, driver):
+    # Scan every row once so the timed run starts on a warm page cache, then fold the WAL back into the database.
+    # This goes through the benchmark's driver: closing a connection from a second SQLite copy in the process
+    # would drop the POSIX locks held by the driver's open connections.
+    conn = open_connection(DB_NAME, optimize_wal, driver)
+    for table, column in [('projects', 'name'), ('users', 'name'), ('tasks', 'description'), ('notes', 'content')]:
+        conn.execute(f'SELECT count(*), sum(length({column})) FROM {table}').fetchone()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    lookup_bytes = bytes_per_lookup(conn, TABLES)
+    conn.close()
+    return lookup_bytes
 
 def main():
     parser = argparse.ArgumentParser(description="Run parallel SQLite queries with read/write ratio control")
@@ -222,8 +433,15 @@ def main():
     parser.add_argument('--warm-up', type=int, default=1000, help='Number of warm-up queries')
     parser.add_argument('--wal', action='store_true', help='Enable WAL mode')
     parser.add_argument('--wal-optimize', action='store_true',help='Optimize WAL mode')
+    parser.add_argument('--batch-size', type=int, default=64, help='Maximum number of writes committed in one transaction')
+    parser.add_argument('--commit-interval', type=float, default=0, help='Milliseconds the writer waits for more writes before committing')
+    parser.add_argument('--page-size', type=int, choices=PAGE_SIZES, default=4096, help='Database page size in bytes')
+    parser.add_argument('--driver', choices=DRIVERS, default='sqlite3', help='SQLite driver used by the benchmark clients')
+    parser.add_argument('--progress', action='store_true', help='Show per-client progress bars while benchmarking')
 
     args = parser.parse_args()
+    if args.driver == 'apsw' and apsw is None:
+        parser.error('the apsw driver requires the apsw package (pip install apsw)')
 
     num_clients = args.clients
     num_queries = args.queries
@@ -231,47 +449,28 @@ def main():
     warm_up_queries = args.warm_up
     wal_mode = args.wal
     wal_optimize = args.wal_optimize
+    driver = args.driver
 
-    init_db(wal_mode)  # Initialize the database
+    init_db(wal_mode, args.page_size)  # Initialize the database
     seed_db()  # Seed the database with initial data
 
     optimize_wal = args.wal_optimize and wal_mode
 
-    warm_up(warm_up_queries, optimize_wal)  # Perform warm-up
-
-    print(f"\nStarting benchmark with {num_clients} clients, {num_queries} queries, and {write_percentage:.1%} write percentage")
-    start_time = time.time() + 3  # Wait for a few seconds before starting the benchmark
-
-    results = run_queries(num_clients, num_queries, write_percentage, start_time, optimize_wal)
-    end_time = time.time()
+    sqlite_version = apsw.sqlite_lib_version() if driver == 'apsw' else sqlite3.sqlite_version
+    print(f"Using the {driver} driver with SQLite {sqlite_version} and {args.page_size} byte pages")
 
-    total_duration = end_time - start_time
-    total_reads = len([r for r in results if r[1] == 'read'])
-    total_writes = len([r for r in results if r[1] == 'write'])
-    read_durations = [r[0] for r in results if r[1] == 'read']
-    write_durations = [r[0] for r in results if r[1] == 'write']
+    writer_thread = start_writer(optimize_wal, driver, args.batch_size, args.commit_interval / 1000)
 
-    read_percentiles = calculate_percentiles(read_durations)
-    write_percentiles = calculate_percentiles(write_durations)
+    warm_up(warm_up_queries, optimize_wal, driver)  # Perform warm-up
+    lookup_bytes = prime_cache(optimize_wal, driver)
 
-    print(f'\nTotal queries: {num_queries}')
-    print(f'Total reads: {total_reads}')
-    print(f'Total writes: {total_writes}')
-    print(f'Total duration: {total_duration:.2f} seconds')
-    print(f'Queries per second: {num_queries / total_duration:.2f}')
-    print(f'Reads per second: {total_reads / total_duration:.2f}')
-    print(f'Writes per second: {total_writes / total_duration:.2f}')
+    print(f"\nStarting benchmark with {num_clients} clients, {num_queries} queries, and {write_percentage:.1%} write percentage")
+    start_time, end_time, bytes_written, durations, is_write = run_queries(num_clients, num_queries, write_percentage, optimize_wal, driver, args.progress)
 
-    table = [[f"P{p}", f"{write_percentiles[p]:.3f}", f"{read_percentiles[p]:.3f}"] for p in sorted(read_percentiles.keys(), reverse=True)]
-    print('\nPercentiles (milliseconds):')
-    print(tabulate(table, headers=['Percentile', 'Write', 'Read'], tablefmt='grid'))
+    stop_writer(writer_thread)
 
-    # Add average (mean) durations
-    avg_write = np.mean(write_durations) * 1000  # Convert to milliseconds
-    avg_read = np.mean(read_durations) * 1000    # Convert to milliseconds
-    print(f"\nAverage durations (milliseconds):")
-    print(f"Write: {avg_write:.3f}")
-    print(f"Read: {avg_read:.3f}")
+    total_duration = end_time - start_time
+    print_results(durations, is_write, num_queries, total_duration, lookup_bytes, bytes_written)
 
 if __name__ == '__main__':
     main()